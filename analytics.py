@@ -0,0 +1,202 @@
+"""Bankroll analytics over a stream of per-hand chip changes.
+
+Simulation workers feed every hand's chip change into a BankrollAnalytics, which never keeps the
+trajectory itself: the stream is cut into trajectories of a fixed number of hands, each starting
+from the same bankroll (like GameState.chips), and summarised with online accumulators as it goes.
+
+    - risk of ruin: the share of trajectories whose bankroll can no longer cover a hand
+    - drawdowns: the largest peak-to-trough fall of each trajectory, as a fixed-bin histogram
+    - N0: the number of hands it takes for the expected win to equal one standard deviation
+    - bankroll percentiles: a reservoir sample of the bankroll at evenly spaced checkpoints
+
+Analytics from separate workers are combined with merge().
+
+"""
+import math
+import random
+
+
+class RunningStats:
+    """Mean and variance in one pass (Welford), mergeable across workers (Chan et al.)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def deviation(self):
+        return math.sqrt(self.variance())
+
+
+class Reservoir:
+    """A uniform sample of at most size values from a stream of unknown length (Algorithm R)."""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.values = list()
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = self.rng.randrange(self.seen)
+            if slot < self.size:
+                self.values[slot] = value
+
+    def merge(self, other):
+        """Combine two samples, drawing from each in proportion to how many values it has seen."""
+        ours, theirs = self.values[:], other.values[:]
+        seen_ours, seen_theirs = self.seen, other.seen
+        merged = list()
+        while len(merged) < self.size and (ours or theirs):
+            if theirs and (not ours or self.rng.randrange(seen_ours + seen_theirs) >= seen_ours):
+                merged.append(theirs.pop(self.rng.randrange(len(theirs))))
+                seen_theirs -= 1
+            else:
+                merged.append(ours.pop(self.rng.randrange(len(ours))))
+                seen_ours -= 1
+        self.values = merged
+        self.seen += other.seen
+
+    def percentile(self, p):
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)]
+
+
+class BankrollAnalytics:
+    """Risk of ruin, drawdowns, N0 and bankroll percentiles from a stream of per-hand chip changes."""
+
+    def __init__(self, bankroll=100, horizon=10000, checkpoints=20, sample_size=1000,
+                 drawdown_bin=None, drawdown_bins=50, seed=None):
+        self.bankroll = bankroll
+        self.horizon = horizon
+        self.checkpoint_every = max(horizon // checkpoints, 1)
+        self.drawdown_bin = drawdown_bin or max(bankroll // 10, 1)
+        self.rng = random.Random(seed)
+        self.hands = RunningStats()
+        self.drawdowns = RunningStats()
+        self.drawdown_histogram = [0] * drawdown_bins      # last bin collects everything beyond
+        self.curves = [Reservoir(sample_size, self.rng) for _ in range(horizon // self.checkpoint_every)]
+        self.trajectories = 0
+        self.ruined = 0
+        self.start_trajectory()
+
+    def start_trajectory(self):
+        self.chips = self.bankroll
+        self.peak = self.bankroll
+        self.max_drawdown = 0
+        self.hand = 0
+
+    def add(self, delta):
+        """Add one hand's chip change, returning True if it ended the trajectory."""
+        self.hands.add(delta)
+        self.chips += delta
+        self.hand += 1
+        if self.chips > self.peak:
+            self.peak = self.chips
+        elif self.peak - self.chips > self.max_drawdown:
+            self.max_drawdown = self.peak - self.chips
+        if self.hand % self.checkpoint_every == 0:
+            self.curves[self.hand // self.checkpoint_every - 1].add(self.chips)
+        if self.chips < 1:
+            # ruined: the bankroll stays where it fell for the rest of the horizon
+            for checkpoint in range(self.hand // self.checkpoint_every, len(self.curves)):
+                self.curves[checkpoint].add(self.chips)
+            self.ruined += 1
+            self.end_trajectory()
+            return True
+        if self.hand == self.horizon:
+            self.end_trajectory()
+            return True
+        return False
+
+    def end_trajectory(self):
+        self.trajectories += 1
+        self.drawdowns.add(self.max_drawdown)
+        self.drawdown_histogram[min(self.max_drawdown // self.drawdown_bin, len(self.drawdown_histogram) - 1)] += 1
+        self.start_trajectory()
+
+    def feed(self, deltas, restart=None):
+        """Add every chip change from deltas, calling restart(bankroll) whenever a new trajectory starts.
+
+        A table producing deltas lazily is put back to the bankroll by restart before its next hand,
+        so the table's chips always match the trajectory's.
+
+        """
+        for delta in deltas:
+            if self.add(delta) and restart:
+                restart(self.bankroll)
+        return self
+
+    def merge(self, other):
+        """Fold in the results of another worker; its unfinished trajectory is dropped."""
+        self.hands.merge(other.hands)
+        self.drawdowns.merge(other.drawdowns)
+        self.drawdown_histogram = [a + b for a, b in zip(self.drawdown_histogram, other.drawdown_histogram)]
+        for curve, other_curve in zip(self.curves, other.curves):
+            curve.merge(other_curve)
+        self.trajectories += other.trajectories
+        self.ruined += other.ruined
+        return self
+
+    def risk_of_ruin(self):
+        return self.ruined / self.trajectories if self.trajectories else None
+
+    def n0(self):
+        """Hands needed for the expected result to equal one standard deviation: variance / mean^2."""
+        if self.hands.mean == 0:
+            return math.inf
+        return self.hands.variance() / (self.hands.mean * self.hands.mean)
+
+    def drawdown_percentile(self, p):
+        """Return the upper edge of the histogram bin holding the p-th percentile of max drawdowns."""
+        if not self.trajectories:
+            return None
+        target = p / 100 * self.trajectories
+        running = 0
+        for i, count in enumerate(self.drawdown_histogram):
+            running += count
+            if running >= target:
+                break
+        return (i + 1) * self.drawdown_bin
+
+    def percentile_curves(self, percentiles=(5, 25, 50, 75, 95)):
+        """Return [(hand, [bankroll at each percentile]), ...] for each checkpoint."""
+        return [((i + 1) * self.checkpoint_every, [curve.percentile(p) for p in percentiles])
+                for i, curve in enumerate(self.curves)]
+
+    def report(self, percentiles=(5, 25, 50, 75, 95)):
+        lines = [
+            'bankroll {} over {} hands: {} trajectories'.format(self.bankroll, self.horizon, self.trajectories),
+            '    risk of ruin:  {}'.format('-' if self.risk_of_ruin() is None else '{:.2%}'.format(self.risk_of_ruin())),
+            '    N0:            {:.0f} hands'.format(self.n0()),
+            '    max drawdown:  mean {:.1f}, standard deviation {:.1f}, p50 <= {}, p95 <= {}'.format(
+                self.drawdowns.mean, self.drawdowns.deviation(), self.drawdown_percentile(50), self.drawdown_percentile(95)),
+            '    bankroll at   ' + ''.join('{:>8}'.format('p{}'.format(p)) for p in percentiles),
+        ]
+        for hand, values in self.percentile_curves(percentiles):
+            lines.append('    {:>10} ' .format(hand) + ''.join('{:>8}'.format('-' if v is None else v) for v in values))
+        return '\n'.join(lines)
@@ -1,6 +1,13 @@
 import time
+START_TIME = time.perf_counter()    # taken before the heavier imports, for --startup-time
+import argparse
+import atexit
+import os
+import threading
 import pyxel
 import dovetail
+import profiling
+from rules import Rules
 
 
 SCREEN_WIDTH = 255
@@ -34,6 +41,9 @@ SPLIT_Y = SCREEN_HEIGHT - CARD_HEIGHT - 12
 CHIPS_X = SCREEN_WIDTH // 2 - 24
 CHIPS_Y = SCREEN_HEIGHT - 8
 
+RESOURCE_FILE = 'blackjack.pyxel'
+IMAGE_FILES = ['suits.png', 'values.png', 'card_back.png']
+
 INTRO = 0
 BET = 1
 INSURE = 2
@@ -42,6 +52,7 @@ SPLIT = 4
 DEALER = 5
 PAYOUT = 6
 SPLASH = 7
+STATE_NAMES = ['INTRO', 'BET', 'INSURE', 'PLAY', 'SPLIT', 'DEALER', 'PAYOUT', 'SPLASH']
 
 UP = pyxel.KEY_UP
 DOWN = pyxel.KEY_DOWN
@@ -98,6 +109,7 @@ class Card:
 
 class Hand:
     def __init__(self, x, y):
+        self.version = 0    # bumped whenever something drawn by Hand.draw changes, see Scene
         self.cards = list()
         self.x = x
         self.y = y
@@ -108,14 +120,29 @@ class Hand:
     def __len__(self):
         return len(self.cards)
 
+    @property
+    def bet(self):
+        return self._bet
+
+    @bet.setter
+    def bet(self, bet):
+        self._bet = bet
+        self.version += 1
+
     def add(self, card):
         assert isinstance(card, Card)
         self.cards.append(card)
+        self.version += 1
+
+    def pop(self):
+        self.version += 1
+        return self.cards.pop()
 
     def clear(self):
         self.cards = list()
         self.double = False
         self.insured = False
+        self.version += 1
 
     def value(self):
         total = 0
@@ -128,6 +155,11 @@ class Hand:
             total += 10
         return total
 
+    def soft(self):
+        """Whether value() is counting an ace as 11."""
+        total = sum(min(card.value, 10) for card in self.cards)
+        return total <= 11 and any(card.value == 1 for card in self.cards)
+
     def value_text(self, hide_first=False):
         total = 0
         ace = False
@@ -156,52 +188,98 @@ class Hand:
             pyxel.text(self.x + CARD_WIDTH * 2, self.y + CARD_HEIGHT + 4, 'BET: ${}'.format(self.bet), GOLD)
 
 
+class Scene:
+    """Keep what is already on the screen and redraw only the regions that have changed.
+
+    Each frame the table is described as a list of layers, (name, key, region, draw), in drawing
+    order. A layer whose key differs from the last frame, or which has appeared or gone away, marks
+    its region dirty. Each dirty region is cleared to the background and every layer overlapping it
+    is redrawn, clipped to that region, so the rest of the screen is left as it was.
+
+    """
+    def __init__(self, background):
+        self.background = background
+        self.layers = {}
+
+    def compose(self, layers):
+        if not self.layers:
+            pyxel.cls(self.background)
+        dirty = [region for name, (key, region) in self.layers.items() if name not in {layer[0] for layer in layers}]
+        for name, key, region, _ in layers:
+            if name not in self.layers or self.layers[name][0] != key:
+                dirty.append(region)
+        self.layers = {name: (key, region) for name, key, region, _ in layers}
+        for x1, y1, x2, y2 in dirty:
+            pyxel.clip(x1, y1, x2, y2)
+            pyxel.rect(x1, y1, x2, y2, self.background)
+            for _, _, (lx1, ly1, lx2, ly2), draw in layers:
+                if lx1 <= x2 and x1 <= lx2 and ly1 <= y2 and y1 <= ly2:
+                    draw()
+        if dirty:
+            pyxel.clip()
+        return len(dirty)
+
+
 class GameState:
 
-    def __init__(self):
+    def __init__(self, btnp=pyxel.btnp, dealer_delay=DEALER_DELAY, new_shoe=None, rules=None, profiler=None):
         self.state = INTRO
-        self.shoe = self.generate_new_shoe()
+        self.rules = rules or Rules()
+        self.btnp = btnp                    # input source, swapped out by crosscheck.py to replay scripts
+        self.dealer_delay = dealer_delay
+        self.new_shoe = new_shoe or self.generate_new_shoe
+        if profiler is not None:
+            # before the shuffler starts, so the first shoe is timed too
+            profiling.instrument_game(self, profiler, STATE_NAMES)
+        self.shoe = list()
+        # the first shoe is shuffled while the INTRO screen is up, and waited on at the first deal
+        self.shuffler = threading.Thread(target=self.shuffle_first_shoe, daemon=True)
+        self.shuffler.start()
         self.dealer = Hand(DEALER_X, DEALER_Y)
         self.player = Hand(PLAYER_X, PLAYER_Y)
         self.split = Hand(SPLIT_X, SPLIT_Y)
         self.chips = 100    # TODO -- load chips from file
 
-    def generate_new_shoe(self, num_decks=8):
+    def generate_new_shoe(self):
         shoe = list()
-        for _ in range(num_decks):
+        for _ in range(self.rules.num_decks):
             for v in range(1, 14):
                 for s in range(4):
                     shoe.append(Card(v, s))
         return dovetail.shuffle(shoe)
 
+    def shuffle_first_shoe(self):
+        self.shoe = self.new_shoe()
+
     def draw_chips(self):
         pyxel.text(CHIPS_X, CHIPS_Y, 'CHIPS: ${}'.format(self.chips), WHITE)
 
     def update(self):
         if self.state == INTRO:
             for button in NEXT_BUTTONS:
-                if pyxel.btnp(button):
+                if self.btnp(button):
                     self.player.bet = 5
                     self.state = BET
         elif self.state == BET:
-            if pyxel.btnp(UP):
+            if self.btnp(UP):
                 self.player.bet += 5
                 self.player.bet = min(self.player.bet, self.chips)
-            elif pyxel.btnp(DOWN):
+            elif self.btnp(DOWN):
                 self.player.bet -= 5
                 self.player.bet = max(self.player.bet, 0)
-            if pyxel.btnp(RIGHT):
+            if self.btnp(RIGHT):
                 self.player.bet += 1
                 self.player.bet = min(self.player.bet, self.chips)
-            elif pyxel.btnp(LEFT):
+            elif self.btnp(LEFT):
                 self.player.bet -= 1
                 self.player.bet = max(self.player.bet, 0)
             else:
                 for button in NEXT_BUTTONS:
-                    if self.player.bet > 0 and pyxel.btnp(button):
+                    if self.player.bet > 0 and self.btnp(button):
                         self.chips -= self.player.bet
+                        self.shuffler.join()
                         if len(self.shoe) < 20:
-                            self.shoe = self.generate_new_shoe()
+                            self.shoe = self.new_shoe()
                         for _ in range(2):
                             self.player.add(self.shoe.pop())
                             self.dealer.add(self.shoe.pop())
@@ -214,14 +292,14 @@ class GameState:
                                 self.state = PLAY
         elif self.state == INSURE:
             if self.chips >= self.player.bet // 2:
-                if pyxel.btnp(Y):
+                if self.btnp(Y):
                     self.chips -= self.player.bet // 2
                     self.player.insured = True
                     if self.player.value() == 21 or self.dealer.value():
                         self.state = PAYOUT
                     else:
                         self.state = PLAY
-                if pyxel.btnp(N):
+                if self.btnp(N):
                     if self.player.value() == 21 or self.dealer.value():
                         self.state = PAYOUT
                     else:
@@ -232,27 +310,27 @@ class GameState:
                 else:
                     self.state = PLAY
         elif self.state == PLAY:
-            if pyxel.btnp(HIT_BUTTON):
+            if self.btnp(HIT_BUTTON):
                 self.player.add(self.shoe.pop())
                 if self.player.value() > 21:
                     if len(self.split) > 0:
                         self.state = SPLIT
                     else:
                         self.state = SPLASH
-            if pyxel.btnp(STAND_BUTTON):
+            if self.btnp(STAND_BUTTON):
                 if len(self.split) > 0:
                     self.state = SPLIT
                 else:
                     self.state = DEALER
-            if pyxel.btnp(SPLIT_BUTTON) and len(self.player) == 2 and len(self.split) == 0 and self.player.cards[0].value == self.player.cards[1].value and self.chips >= self.player.bet:
+            if self.btnp(SPLIT_BUTTON) and len(self.player) == 2 and len(self.split) == 0 and self.player.cards[0].value == self.player.cards[1].value and self.chips >= self.player.bet:
                 self.chips -= self.player.bet
                 self.split.bet = self.player.bet
-                self.split.add(self.player.cards.pop())
+                self.split.add(self.player.pop())
                 self.player.add(self.shoe.pop())
                 self.split.add(self.shoe.pop())
                 if self.player.value() == 21:
                     self.state = SPLIT
-            if pyxel.btnp(DOUBLE_BUTTON) and len(self.player) == 2 and len(self.split) == 0 and self.chips >= self.player.bet:
+            if self.btnp(DOUBLE_BUTTON) and len(self.player) == 2 and len(self.split) == 0 and self.chips >= self.player.bet:
                 self.chips -= self.player.bet
                 self.player.double = True
                 self.player.add(self.shoe.pop())
@@ -263,25 +341,25 @@ class GameState:
                     self.state = PAYOUT
                 else:
                     self.state = DEALER
-            if pyxel.btnp(HIT_BUTTON):
+            if self.btnp(HIT_BUTTON):
                 self.split.add(self.shoe.pop())
                 if self.split.value() > 21:
                     if self.player.value() > 21:
                         self.state = PAYOUT
                     else:
                         self.state = DEALER
-            if pyxel.btnp(STAND_BUTTON):
+            if self.btnp(STAND_BUTTON):
                 self.state = DEALER
         elif self.state == DEALER:
-            time.sleep(DEALER_DELAY)
-            if self.dealer.value() < 17:
+            time.sleep(self.dealer_delay)
+            if self.rules.dealer_hits(self.dealer.value(), self.dealer.soft()):
                 self.dealer.add(self.shoe.pop())
             else:
                 self.state = PAYOUT
         elif self.state == PAYOUT:
             if len(self.split) > 0 and self.split.value() <= 21:
                 if len(self.split) == 2 and self.split.value() == 21:
-                    self.chips += 2 * self.split.bet + self.split.bet // 2
+                    self.chips += self.split.bet + self.rules.blackjack_winnings(self.split.bet)
                 elif self.split.value() > self.dealer.value() or self.dealer.value() > 21:
                     self.chips += self.split.bet * 2
                 elif self.split.value() == self.dealer.value():
@@ -298,7 +376,7 @@ class GameState:
                             else:
                                 self.chips += self.player.bet + self.player.bet // 2
                     else:
-                        self.chips += self.player.bet * 2 + self.player.bet // 2
+                        self.chips += self.player.bet + self.rules.blackjack_winnings(self.player.bet)
                 elif self.player.value() > self.dealer.value() or self.dealer.value() > 21:
                     self.chips += self.player.bet * 2
                     if self.player.double:
@@ -310,7 +388,7 @@ class GameState:
             self.state = SPLASH
         elif self.state == SPLASH:
             for button in NEXT_BUTTONS:
-                if pyxel.btnp(button):
+                if self.btnp(button):
                     self.player.clear()
                     self.dealer.clear()
                     self.split.clear()
@@ -321,13 +399,13 @@ class GameState:
 
 
 class App:
-    def __init__(self):
+    def __init__(self, measure_startup=False, profiler=None):
         pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT, caption='Blackjack')
-        pyxel.image(0).load(0, 0, 'suits.png')
-        pyxel.image(1).load(0, 0, 'values.png')
-        pyxel.image(2).load(0, 0, 'card_back.png')
-        self.game = GameState()
+        self.assets_loaded = False      # nothing on the INTRO screen needs them
+        self.measure_startup = measure_startup
+        self.game = GameState(profiler=profiler)
         self.debug = Debug()
+        self.scene = Scene(GREEN)
         '''self.player = Hand(PLAYER_X, PLAYER_Y)
         self.dealer = Hand(DEALER_X, DEALER_Y)
         self.split = Hand(SPLIT_X, SPLIT_Y)'''
@@ -336,39 +414,57 @@ class App:
     def update(self):
         self.game.update()
 
-    def draw(self):
-        pyxel.cls(GREEN)
-        self.debug.draw(self.game)
-        if self.game.state == INTRO:
-            pass    # TODO -- draw intro
+    def load_assets(self):
+        if os.path.exists(RESOURCE_FILE):
+            pyxel.load(RESOURCE_FILE)
         else:
-            self.game.draw_chips()
-            self.game.player.draw()
-            self.game.split.draw()
-        if self.game.state in [BET, INSURE, PLAY, SPLIT]:
-            self.game.dealer.draw(hide_first=True)
+            load_images()
+        self.assets_loaded = True
+
+    def draw(self):
+        game = self.game
+        hide_hole = game.state in [BET, INSURE, PLAY, SPLIT]
+        layers = [('debug', game.state, (SCREEN_WIDTH - 10, 4, SCREEN_WIDTH - 1, 9), lambda: self.debug.draw(game))]
+        if game.state == INTRO:
+            flash_color = FLASH_SEQUENCE[(pyxel.frame_count // 4) % len(FLASH_SEQUENCE)]
+            layers.append(('title', None, (SCREEN_WIDTH // 2 - 40, SCREEN_HEIGHT // 3, SCREEN_WIDTH // 2 + 44, SCREEN_HEIGHT // 3 + 5), self.draw_title))
+            layers.append(('prompt', flash_color, (SCREEN_WIDTH // 2 - 54, 3 * SCREEN_HEIGHT // 5, SCREEN_WIDTH // 2 + 62, 3 * SCREEN_HEIGHT // 5 + 5), self.draw_prompt))
         else:
-            self.game.dealer.draw()
-        if self.game.state == INSURE:
+            if not self.assets_loaded:
+                self.load_assets()
+            layers.append(('chips', game.chips, (CHIPS_X, CHIPS_Y, SCREEN_WIDTH - 1, CHIPS_Y + 5), game.draw_chips))
+            layers.append(('player', game.player.version, hand_region(game.player), game.player.draw))
+            layers.append(('split', game.split.version, hand_region(game.split), game.split.draw))
+        layers.append(('dealer', (game.dealer.version, hide_hole), hand_region(game.dealer), lambda: game.dealer.draw(hide_first=hide_hole)))
+        if game.state == INSURE:
             pass    # TODO -- draw insurance y/n box
-        if self.game.state == SPLASH:
-            if len(self.game.split) > 0:
-                if self.game.split.value() > 21:
-                    self.draw_bust(self.game.split.x, self.game.split.y)
-                elif self.game.split.value() > self.game.dealer.value() or self.game.dealer.value() > 21:
-                    self.draw_win(self.game.split.x, self.game.split.y)
-                elif self.game.split.value() == self.game.dealer.value():
-                    self.draw_push(self.game.split.x, self.game.split.y)
-                else:
-                    self.draw_lose(self.game.split.x, self.game.split.y)
-            if self.game.player.value() > 21:
-                self.draw_bust(self.game.player.x, self.game.player.y)
-            elif self.game.player.value() > self.game.dealer.value() or self.game.dealer.value() > 21:
-                self.draw_win(self.game.player.x, self.game.player.y)
-            elif self.game.player.value() == self.game.dealer.value():
-                self.draw_push(self.game.player.x, self.game.player.y)
-            else:
-                self.draw_lose(self.game.player.x, self.game.player.y)
+        if game.state == SPLASH:
+            for name, hand in [('split result', game.split), ('player result', game.player)]:
+                if len(hand) > 0:
+                    banner = self.result_banner(hand)
+                    layers.append((name, banner, (hand.x + 8, hand.y + 16, hand.x + 33, hand.y + 26), lambda banner=banner, hand=hand: banner(hand.x, hand.y)))
+        self.scene.compose(layers)
+        if self.measure_startup:
+            print('Time to first frame: {:.1f} ms'.format((time.perf_counter() - START_TIME) * 1000))
+            pyxel.quit()
+
+    def draw_title(self):
+        pyxel.text(SCREEN_WIDTH // 2 - 40, SCREEN_HEIGHT // 3, 'Welcome to BLACKJACK!', GOLD)
+
+    def draw_prompt(self):
+        flash_color = FLASH_SEQUENCE[(pyxel.frame_count // 4) % len(FLASH_SEQUENCE)]
+        pyxel.text(SCREEN_WIDTH // 2 - 54, 3 * SCREEN_HEIGHT // 5, 'Press SPACE or ENTER to begin', flash_color)
+
+    def result_banner(self, hand):
+        dealer_value = self.game.dealer.value()
+        if hand.value() > 21:
+            return self.draw_bust
+        elif hand.value() > dealer_value or dealer_value > 21:
+            return self.draw_win
+        elif hand.value() == dealer_value:
+            return self.draw_push
+        else:
+            return self.draw_lose
 
     def draw_bust(self, x, y):
         pyxel.rect(x + 8, y + 16, x + 33, y + 26, RED)
@@ -387,4 +483,38 @@ class App:
         pyxel.text(x + 12, y + 19, 'LOSE', WHITE)
 
 
-App()
+def hand_region(hand):
+    """Return the screen region a hand can draw into; long hands run on to the right-hand edge."""
+    return hand.x, hand.y, SCREEN_WIDTH - 1, hand.y + CARD_HEIGHT + 9
+
+
+def load_images():
+    for bank, filename in enumerate(IMAGE_FILES):
+        pyxel.image(bank).load(0, 0, filename)
+
+
+def build_resources():
+    """Bake the PNG image banks into RESOURCE_FILE, which App loads in one go when it exists."""
+    pyxel.init(SCREEN_WIDTH, SCREEN_HEIGHT)
+    load_images()
+    pyxel.save(RESOURCE_FILE)
+    print('Saved image banks to {}'.format(RESOURCE_FILE))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Blackjack')
+    parser.add_argument('--startup-time', action='store_true', help='report the time to the first frame and quit')
+    parser.add_argument('--build-resources', action='store_true', help='rebuild {} from the PNGs'.format(RESOURCE_FILE))
+    parser.add_argument('--profile', metavar='FILE', help='time state transitions and shuffles, saved on exit as '
+                                                          'pstats data, collapsed stacks if FILE ends in .folded, or '
+                                                          'a Chrome trace of recent events if it ends in .json')
+    args = parser.parse_args()
+    if args.build_resources:
+        build_resources()
+    else:
+        profiler = None
+        if args.profile:
+            profiler = profiling.Profiler()
+            profiling.instrument_dovetail(profiler)
+            atexit.register(profiler.export, args.profile)
+        App(measure_startup=args.startup_time, profiler=profiler)
@@ -0,0 +1,174 @@
+"""Cross-check the fast engines against the rules in blackjack02.GameState.
+
+GameState is the reference: it is fed seeded shoes and scripted key presses one frame at a time, and
+every engine in ENGINES plays the same shoes and scripts under the same Rules. The chip change of
+every hand is compared, and the first hand that differs is reported with everything needed to replay
+it.
+
+Run with, e.g.:     python crosscheck.py --hands 1000000 --workers 8 --decks 2 --h17 --payout 6:5
+
+or through pytest (test_crosscheck.py), which checks a million hands unless run with -m 'not slow'.
+
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+
+import blackjack02
+import fastgame
+from rules import Rules, add_rules_arguments, rules_from_arguments
+
+ENGINES = {
+    'fastgame': fastgame.FastTable,
+}
+
+KEYS = {
+    fastgame.HIT: blackjack02.HIT_BUTTON,
+    fastgame.STAND: blackjack02.STAND_BUTTON,
+    fastgame.DOUBLE: blackjack02.DOUBLE_BUTTON,
+    fastgame.SPLIT_PAIR: blackjack02.SPLIT_BUTTON,
+    fastgame.YES: blackjack02.Y,
+    fastgame.NO: blackjack02.N,
+}
+DECISION_STATES = (blackjack02.INSURE, blackjack02.PLAY, blackjack02.SPLIT)
+
+STARTING_CHIPS = 100
+MAX_BET = 50
+MAX_SCRIPT_LENGTH = 8
+HANDS_PER_SESSION = 10000
+
+
+class Script:
+    """Hand out scripted actions one at a time, standing (or declining insurance) once they run out."""
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.position = 0
+
+    def __call__(self, phase, cards, upcard):
+        if self.position < len(self.actions):
+            self.position += 1
+            return self.actions[self.position - 1]
+        return fastgame.NO if phase == fastgame.INSURE else fastgame.STAND
+
+
+class ScriptedInput:
+    """Stand in for pyxel.btnp, reporting a single key as pressed."""
+
+    def __init__(self):
+        self.key = None
+
+    def __call__(self, key):
+        return key == self.key
+
+
+class Reference:
+    """Drive GameState through whole hands, one frame at a time, like a player at the keyboard."""
+
+    def __init__(self, new_shoe, chips=STARTING_CHIPS, rules=None):
+        self.input = ScriptedInput()
+        cards = lambda: [blackjack02.Card(v, s) for v, s in new_shoe()]
+        self.game = blackjack02.GameState(btnp=self.input, dealer_delay=0, new_shoe=cards, rules=rules)
+        self.game.chips = chips
+        self.game.state = blackjack02.BET
+
+    @property
+    def chips(self):
+        return self.game.chips
+
+    @chips.setter
+    def chips(self, chips):
+        self.game.chips = chips
+
+    def frame(self, key=None):
+        self.input.key = key
+        self.game.update()
+
+    def play(self, bet, decide):
+        game = self.game
+        start_chips = game.chips
+        game.player.bet = bet
+        self.frame(blackjack02.ENTER)
+        while game.state != blackjack02.SPLASH:
+            # let the state settle on its own before pressing anything, so an action is only ever
+            # spent where the fast engines would ask for one
+            state = game.state
+            self.frame()
+            if game.state == state and state in DECISION_STATES:
+                upcard = game.dealer.cards[1].value
+                cards = [card.value for card in (game.split if state == blackjack02.SPLIT else game.player).cards]
+                self.frame(KEYS[decide(state, cards, upcard)])
+        delta = game.chips - start_chips
+        self.frame(blackjack02.ENTER)
+        return delta
+
+
+def check_session(seed, hands, engines=tuple(ENGINES), rules=None):
+    """Play a seeded session on the reference and on each engine, returning the first mismatch or None."""
+    rules = rules or Rules()
+    tables = [('reference', Reference(fastgame.ShoeFactory(seed, rules.num_decks), STARTING_CHIPS, rules))]
+    tables.extend((name, ENGINES[name](fastgame.CardValues(fastgame.ShoeFactory(seed, rules.num_decks)), STARTING_CHIPS, rules))
+                  for name in engines)
+    rng = random.Random(seed)
+    for hand in range(hands):
+        chips = tables[0][1].chips
+        if chips < 1:
+            chips = STARTING_CHIPS
+            for _, table in tables:
+                table.chips = chips
+        bet = rng.randint(1, min(chips, MAX_BET))
+        actions = ''.join(rng.choice(fastgame.ACTIONS) for _ in range(rng.randint(0, MAX_SCRIPT_LENGTH)))
+        deltas = [(name, table.play(bet, Script(actions))) for name, table in tables]
+        if any(delta != deltas[0][1] for _, delta in deltas):
+            return {'seed': seed, 'hand': hand, 'chips': chips, 'bet': bet, 'actions': actions, 'deltas': deltas}
+    return None
+
+
+def _check_session(args):
+    return check_session(*args)
+
+
+def check(hands, seed=0, workers=None, engines=tuple(ENGINES), rules=None):
+    """Check hands in sessions seeded seed, seed + 1, ... across worker processes.
+
+    Returns the first mismatch found, or None. Leaving the pool terminates the sessions still running.
+
+    """
+    sessions = []
+    remaining = hands
+    while remaining > 0:
+        sessions.append((seed, min(remaining, HANDS_PER_SESSION), engines, rules))
+        remaining -= HANDS_PER_SESSION
+        seed += 1
+
+    with multiprocessing.Pool(workers) as pool:
+        for mismatch in pool.imap_unordered(_check_session, sessions):
+            if mismatch is not None:
+                return mismatch
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hands', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--engine', action='append', choices=sorted(ENGINES), help='default: all of them')
+    add_rules_arguments(parser)
+    args = parser.parse_args()
+    engines = tuple(args.engine or ENGINES)
+    rules = rules_from_arguments(args)
+
+    mismatch = check(args.hands, args.seed, args.workers, engines, rules)
+    if mismatch is not None:
+        print('MISMATCH in session {seed}, hand {hand}: chips={chips} bet={bet} actions={actions!r}'.format(**mismatch))
+        for name, delta in mismatch['deltas']:
+            print('    {:>10}: {:+d}'.format(name, delta))
+        return 1
+    print('OK: {} hands across {} engine(s) match the reference with {}'.format(args.hands, len(engines), rules))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Play blackjack hands without pyxel.
+
+FastTable plays the same rules as blackjack02.GameState, but a whole hand at a time instead of one
+frame at a time, with cards stored as plain values (1 - 13) and no dealer delay. This is what the
+simulations are built on, so crosscheck.py holds it to GameState hand for hand.
+
+Decisions are made by a callable, decide(phase, cards, upcard), which is asked for one action at a
+time and returns one of the ACTIONS characters. Anything that isn't valid at that point is ignored,
+just as an unhandled key press is ignored by GameState.
+
+"""
+import random
+
+from rules import Rules
+
+# decision phases, numbered the same as the states in blackjack02
+INSURE = 2
+PLAY = 3
+SPLIT = 4
+
+HIT = 'H'
+STAND = 'S'
+DOUBLE = 'D'
+SPLIT_PAIR = 'P'
+YES = 'Y'
+NO = 'N'
+ACTIONS = HIT + STAND + DOUBLE + SPLIT_PAIR + YES + NO
+
+RESHUFFLE_AT = 20
+
+
+def hand_value(cards):
+    """Calculate the best blackjack total of a list of card values, counting one ace as 11 if it fits."""
+    total = 0
+    ace = False
+    for value in cards:
+        total += min(value, 10)
+        if value == 1:
+            ace = True
+    if total <= 11 and ace:
+        total += 10
+    return total
+
+
+def is_soft(cards):
+    """Whether hand_value is counting an ace as 11."""
+    return sum(min(value, 10) for value in cards) <= 11 and 1 in cards
+
+
+class ShoeFactory:
+    """Deal out the same sequence of shuffled shoes for the same seed; picklable, RNG state and all."""
+
+    def __init__(self, seed, num_decks=8):
+        self.rng = random.Random(seed)
+        self.cards = [(v, s) for _ in range(num_decks) for v in range(1, 14) for s in range(4)]
+
+    def __call__(self):
+        shoe = self.cards[:]
+        self.rng.shuffle(shoe)
+        return shoe
+
+
+class CardValues:
+    """Wrap a shoe factory so it deals bare card values, as the fast engines expect."""
+
+    def __init__(self, new_shoe):
+        self.new_shoe = new_shoe
+
+    def __call__(self):
+        return [value for value, _ in self.new_shoe()]
+
+
+class FastTable:
+    def __init__(self, new_shoe, chips=100, rules=None):
+        self.rules = rules or Rules()
+        self.new_shoe = new_shoe
+        self.shoe = new_shoe()
+        self.chips = chips
+
+    def play(self, bet, decide):
+        """Play one hand for the given bet and return the change in chips.
+
+        Follows GameState.update from BET through to SPLASH, including its quirks: an ace upcard
+        always goes straight to the payout once insurance has been settled, any 21 on the first
+        two cards is paid as a blackjack unless the dealer also has 21, and a doubled hand is
+        still dealt to even when it busts.
+
+        """
+        start_chips = self.chips
+        shoe = self.shoe
+        self.chips -= bet
+        if len(shoe) < RESHUFFLE_AT:
+            shoe = self.shoe = self.new_shoe()
+        player = [shoe.pop()]
+        dealer = [shoe.pop()]
+        player.append(shoe.pop())
+        dealer.append(shoe.pop())
+        upcard = dealer[1]
+        split = []
+        split_bet = 0
+        double = False
+        insured = False
+
+        if upcard == 1:
+            if self.chips >= bet // 2:
+                while True:
+                    action = decide(INSURE, player, upcard)
+                    if action == YES:
+                        self.chips -= bet // 2
+                        insured = True
+                        break
+                    if action == NO:
+                        break
+        elif hand_value(player) != 21 and hand_value(dealer) != 21:
+            phase = PLAY
+            while phase == PLAY:
+                action = decide(PLAY, player, upcard)
+                if action == HIT:
+                    player.append(shoe.pop())
+                    if hand_value(player) > 21:
+                        if split:
+                            phase = SPLIT
+                        else:
+                            return self.chips - start_chips  # bust, straight to SPLASH
+                elif action == STAND:
+                    phase = SPLIT if split else None
+                elif action == SPLIT_PAIR:
+                    if len(player) == 2 and not split and player[0] == player[1] and self.chips >= bet:
+                        self.chips -= bet
+                        split_bet = bet
+                        split.append(player.pop())
+                        player.append(shoe.pop())
+                        split.append(shoe.pop())
+                        if hand_value(player) == 21:
+                            phase = SPLIT
+                elif action == DOUBLE:
+                    if len(player) == 2 and not split and self.chips >= bet:
+                        self.chips -= bet
+                        double = True
+                        player.append(shoe.pop())
+                        phase = None
+            dealer_plays = True
+            if phase == SPLIT:
+                while True:
+                    if len(split) == 2 and hand_value(split) == 21:
+                        dealer_plays = len(player) != 2 or hand_value(player) != 21
+                        break
+                    action = decide(SPLIT, split, upcard)
+                    if action == HIT:
+                        split.append(shoe.pop())
+                        if hand_value(split) > 21:
+                            dealer_plays = hand_value(player) <= 21
+                            break
+                    elif action == STAND:
+                        break
+            if dealer_plays:
+                while self.rules.dealer_hits(hand_value(dealer), is_soft(dealer)):
+                    dealer.append(shoe.pop())
+
+        self.chips += self.payout(player, dealer, split, bet, split_bet, double, insured)
+        return self.chips - start_chips
+
+    def payout(self, player, dealer, split, bet, split_bet, double, insured):
+        """Calculate the chips returned at the end of a hand, as in the PAYOUT state of GameState."""
+        winnings = 0
+        dealer_value = hand_value(dealer)
+        if split:
+            split_value = hand_value(split)
+            if split_value <= 21:
+                if len(split) == 2 and split_value == 21:
+                    winnings += split_bet + self.rules.blackjack_winnings(split_bet)
+                elif split_value > dealer_value or dealer_value > 21:
+                    winnings += split_bet * 2
+                elif split_value == dealer_value:
+                    winnings += split_bet
+        player_value = hand_value(player)
+        if player_value <= 21:
+            if player_value == 21 or dealer_value == 21:
+                if dealer_value == 21:
+                    if not insured:
+                        if player_value == 21:
+                            winnings += bet
+                    elif player_value == 21:
+                        winnings += bet * 2
+                    else:
+                        winnings += bet + bet // 2
+                else:
+                    winnings += bet + self.rules.blackjack_winnings(bet)
+            elif player_value > dealer_value or dealer_value > 21:
+                winnings += bet * 2
+                if double:
+                    winnings += bet * 2
+            elif player_value == dealer_value:
+                winnings += bet
+                if double:
+                    winnings += bet
+        return winnings
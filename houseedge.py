@@ -0,0 +1,238 @@
+"""Calculate the house edge of a set of table rules by combinatorial analysis.
+
+Instead of simulating hands, every starting deal is weighed by its probability from a full shoe, and
+the player's best play from there is found by recursing over the remaining cards, with the shoe kept
+as a tuple of rank counts (ace - ten) so results can be memoized. The dealer's outcomes are worked
+out for every composition the player can leave behind. Each dealer upcard is analysed in its own
+process.
+
+This models ordinary casino play under the given Rules, not the table in blackjack02.GameState: the
+dealer peeks for blackjack under an ace or ten, the player takes the best of stand, hit, double,
+split and (late) surrender for every starting hand, and insurance is never taken. Two things are
+approximated, as most analyzers do: the two halves of a split are valued as independent copies of the
+first, with no further splits, and the player's draws ignore what the dealer's hole card can't be.
+Resplitting aces isn't modelled at all, so Rules with resplit_aces are refused.
+
+GameState plays quite differently even with the default Rules. Against an ace upcard the hand goes
+straight to the payout once insurance is settled, without the player or the dealer drawing, and any
+21 (after a split, or after drawing) is paid as a blackjack. Its edge is much larger than the figure
+worked out here for the same Rules, and is best measured with simulate.py.
+
+Run with, e.g.:     python houseedge.py --decks 6 --h17 --das --surrender --payout 6:5
+
+"""
+import argparse
+import concurrent.futures
+import time
+
+from rules import add_rules_arguments, rules_from_arguments
+
+RANKS = range(1, 11)    # ace - ten, with all ten-value cards counted together
+BUST = 5                # index of a bust in the dealer outcome list, after 17, 18, 19, 20, 21
+
+
+def full_shoe(num_decks):
+    return tuple(4 * num_decks for _ in range(9)) + (16 * num_decks,)
+
+
+def remove(shoe, rank):
+    return shoe[:rank - 1] + (shoe[rank - 1] - 1,) + shoe[rank:]
+
+
+def add_card(total, soft, rank):
+    """Add a card to a hand held as (total with aces as 1, holds an ace)."""
+    return total + rank, soft or rank == 1
+
+
+def best_value(total, soft):
+    return total + 10 if soft and total <= 11 else total
+
+
+class Analyzer:
+    """Expected values for one dealer upcard, memoized on shoe composition."""
+
+    def __init__(self, rules, upcard):
+        if rules.resplit_aces:
+            raise ValueError('Resplitting aces is not modelled')
+        self.rules = rules
+        self.upcard = upcard
+        self.peeks = upcard in (1, 10)
+        self.dealer_cache = {}
+        self.dealer_state_cache = {}
+        self.stand_cache = {}
+        self.hit_cache = {}
+
+    def dealer_blackjack(self, shoe):
+        """Probability that the dealer's hole card makes a blackjack."""
+        if not self.peeks:
+            return 0.0
+        return shoe[(10 if self.upcard == 1 else 1) - 1] / sum(shoe)
+
+    def dealer_outcomes(self, shoe):
+        """Probabilities of the dealer finishing on 17, 18, 19, 20, 21 or busting, given no blackjack."""
+        outcomes = self.dealer_cache.get(shoe)
+        if outcomes is None:
+            total, soft = add_card(0, False, self.upcard)
+            excluded = (10 if self.upcard == 1 else 1) if self.peeks else None
+            outcomes = self.dealer_draw(total, soft, shoe, excluded)
+            self.dealer_cache[shoe] = outcomes
+        return outcomes
+
+    def dealer_draw(self, total, soft, shoe, excluded=None):
+        """Outcome probabilities for a dealer hand that has to draw, memoized across compositions.
+
+        The player's and the dealer's cards come out of the same shoe, so many different player
+        hands lead to the same dealer hand against the same remaining cards.
+
+        """
+        key = (total, soft, shoe)
+        if excluded is None and key in self.dealer_state_cache:
+            return self.dealer_state_cache[key]
+        outcomes = [0.0] * 6
+        cards = sum(shoe) - (shoe[excluded - 1] if excluded else 0)
+        for rank in RANKS:
+            count = shoe[rank - 1]
+            if count == 0 or rank == excluded:
+                continue
+            p = count / cards
+            new_total, new_soft = add_card(total, soft, rank)
+            value = best_value(new_total, new_soft)
+            if value > 21:
+                outcomes[BUST] += p
+            elif self.rules.dealer_hits(value, new_soft and new_total <= 11):
+                for i, q in enumerate(self.dealer_draw(new_total, new_soft, remove(shoe, rank))):
+                    outcomes[i] += p * q
+            else:
+                outcomes[value - 17] += p
+        if excluded is None:
+            self.dealer_state_cache[key] = outcomes
+        return outcomes
+
+    def stand(self, value, shoe):
+        """Expected value of standing on value, per unit bet."""
+        key = (value, shoe)
+        ev = self.stand_cache.get(key)
+        if ev is None:
+            outcomes = self.dealer_outcomes(shoe)
+            ev = outcomes[BUST]
+            for dealer_value, p in zip(range(17, 22), outcomes):
+                if value > dealer_value:
+                    ev += p
+                elif value < dealer_value:
+                    ev -= p
+            self.stand_cache[key] = ev
+        return ev
+
+    def draws(self, shoe):
+        cards = sum(shoe)
+        return [(rank, shoe[rank - 1] / cards) for rank in RANKS if shoe[rank - 1]]
+
+    def hit(self, total, soft, shoe):
+        """Expected value of hitting, then playing on as well as possible without doubling."""
+        key = (total, soft, shoe)
+        ev = self.hit_cache.get(key)
+        if ev is None:
+            ev = 0.0
+            for rank, p in self.draws(shoe):
+                new_total, new_soft = add_card(total, soft, rank)
+                value = best_value(new_total, new_soft)
+                if value > 21:
+                    ev -= p
+                else:
+                    remaining = remove(shoe, rank)
+                    ev += p * max(self.stand(value, remaining), self.hit(new_total, new_soft, remaining))
+            self.hit_cache[key] = ev
+        return ev
+
+    def double(self, total, soft, shoe):
+        ev = 0.0
+        for rank, p in self.draws(shoe):
+            new_total, new_soft = add_card(total, soft, rank)
+            value = best_value(new_total, new_soft)
+            ev += p * (-1 if value > 21 else self.stand(value, remove(shoe, rank)))
+        return 2 * ev
+
+    def split(self, rank, shoe):
+        """Expected value of splitting a pair, from one half valued as if it were played twice."""
+        ev = 0.0
+        for second, p in self.draws(shoe):
+            total, soft = add_card(*add_card(0, False, rank), second)
+            remaining = remove(shoe, second)
+            value = best_value(total, soft)
+            if rank == 1:
+                ev += p * self.stand(value, remaining)    # split aces get one card each
+                continue
+            options = [self.stand(value, remaining), self.hit(total, soft, remaining)]
+            if self.rules.double_after_split:
+                options.append(self.double(total, soft, remaining))
+            ev += p * max(options)
+        return 2 * ev
+
+    def initial(self, first, second, shoe):
+        """Expected value of a starting hand, with shoe holding the cards left after the deal."""
+        total, soft = add_card(*add_card(0, False, first), second)
+        value = best_value(total, soft)
+        dealer_blackjack = self.dealer_blackjack(shoe)
+        if value == 21:
+            return (1 - dealer_blackjack) * self.rules.blackjack_ratio()
+        options = [self.stand(value, shoe), self.hit(total, soft, shoe), self.double(total, soft, shoe)]
+        if first == second:
+            options.append(self.split(first, shoe))
+        if self.rules.surrender:
+            options.append(-0.5)
+        return -dealer_blackjack + (1 - dealer_blackjack) * max(options)
+
+    def expected_value(self):
+        """Expected value per unit bet over every deal with this upcard, weighted by its probability."""
+        shoe = full_shoe(self.rules.num_decks)
+        ev = 0.0
+        cards = sum(shoe)
+        p_up = shoe[self.upcard - 1] / cards
+        shoe = remove(shoe, self.upcard)
+        for first in RANKS:
+            p_first = p_up * shoe[first - 1] / (cards - 1)
+            after_first = remove(shoe, first)
+            for second in RANKS:
+                if second < first:
+                    continue
+                p = p_first * after_first[second - 1] / (cards - 2)
+                if second != first:
+                    p *= 2
+                ev += p * self.initial(first, second, remove(after_first, second))
+        return ev
+
+
+def upcard_expected_value(args):
+    rules, upcard = args
+    return upcard, Analyzer(rules, upcard).expected_value()
+
+
+def house_edge(rules, workers=None):
+    """Return (house edge, {upcard: expected value contribution}) for a set of rules under casino play."""
+    if rules.resplit_aces:
+        raise ValueError('Resplitting aces is not modelled')
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        by_upcard = dict(pool.map(upcard_expected_value, [(rules, upcard) for upcard in RANKS]))
+    return -sum(by_upcard.values()), by_upcard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    add_rules_arguments(parser)
+    parser.add_argument('--das', action='store_true', help='double after split')
+    parser.add_argument('--rsa', action='store_true', help='resplit aces (not modelled yet, so refused)')
+    parser.add_argument('--surrender', action='store_true', help='late surrender')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    if args.rsa:
+        parser.error('--rsa: resplitting aces is not modelled yet')
+    rules = rules_from_arguments(args, double_after_split=args.das, surrender=args.surrender)
+
+    start = time.perf_counter()
+    edge, by_upcard = house_edge(rules, args.workers)
+    print(rules)
+    print('    house edge under casino play: {:.4%}   ({:.1f}s)'.format(edge, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Opt-in timing of GameState transitions and shoe shuffling.
+
+Nothing here runs unless it is installed: instrument_game() wraps one GameState's update and shoe
+factory, and instrument_dovetail() wraps the functions in dovetail. Each timed call adds to a count
+and a running total of nanoseconds for its call path, and is written into a fixed-size ring buffer
+of recent events. Frames of GameState.update are named after the state they ran in, 'BET', or the
+transition they made, 'BET->PLAY'.
+
+The totals can be exported as collapsed stacks for flamegraph.pl or speedscope (.folded), or as
+marshalled pstats data that pstats, snakeviz and friends read like a cProfile dump (anything else).
+The recent events can be exported as a timeline in the Chrome trace format (.json), which
+chrome://tracing, Perfetto and speedscope open.
+
+"""
+import json
+import marshal
+import threading
+import time
+from array import array
+
+import dovetail
+
+RING_CAPACITY = 65536
+
+
+class Profiler:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.ring = array('q', bytes(4 * 8 * capacity))     # (event id, thread, start ns, duration ns)
+        self.recorded = 0
+        self.paths = list()         # event id -> call path, outermost first
+        self.ids = dict()
+        self.counts = list()
+        self.total_ns = list()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def record(self, path, start, duration, thread):
+        with self.lock:
+            event = self.ids.get(path)
+            if event is None:
+                event = self.ids[path] = len(self.paths)
+                self.paths.append(path)
+                self.counts.append(0)
+                self.total_ns.append(0)
+            self.counts[event] += 1
+            self.total_ns[event] += duration
+            slot = (self.recorded % self.capacity) * 4
+            self.ring[slot] = event
+            self.ring[slot + 1] = thread
+            self.ring[slot + 2] = start
+            self.ring[slot + 3] = duration
+            self.recorded += 1
+
+    def wrap(self, function, name, rename=None):
+        """Return function timed under name, a string or a function returning one at call time.
+
+        rename(name), if given, is called once an outermost call has returned to give its final
+        name; calls made inside it are held back until then so they are filed under that name too.
+
+        """
+        local = self.local
+
+        def timed(*args, **kwargs):
+            if not hasattr(local, 'stack'):
+                local.stack = list()
+                local.pending = list()
+            stack = local.stack
+            stack.append(name() if callable(name) else name)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter_ns() - start
+                path = tuple(stack)
+                stack.pop()
+                if stack:
+                    local.pending.append((path, start, duration))
+                else:
+                    root = rename(path[0]) if rename else path[0]
+                    thread = threading.get_native_id()
+                    for child_path, child_start, child_duration in local.pending:
+                        self.record((root,) + child_path[1:], child_start, child_duration, thread)
+                    local.pending.clear()
+                    self.record((root,), start, duration, thread)
+        return timed
+
+    def events(self):
+        """Yield (call path, thread, start ns, duration ns) for the events still in the ring buffer, oldest first."""
+        first = max(self.recorded - self.capacity, 0)
+        for i in range(first, self.recorded):
+            slot = (i % self.capacity) * 4
+            yield self.paths[self.ring[slot]], self.ring[slot + 1], self.ring[slot + 2], self.ring[slot + 3]
+
+    def self_ns(self):
+        """Return {call path: nanoseconds not spent in timed calls below it}."""
+        own = dict(zip(self.paths, self.total_ns))
+        for path, total in zip(self.paths, self.total_ns):
+            if len(path) > 1 and path[:-1] in own:
+                own[path[:-1]] -= total
+        return own
+
+    def export_folded(self, filename):
+        with open(filename, 'w') as folded:
+            for path, ns in sorted(self.self_ns().items()):
+                folded.write('{} {}\n'.format(';'.join(path), max(ns, 0)))
+
+    def export_pstats(self, filename):
+        """Write the totals in the marshalled format pstats.Stats loads cProfile dumps from."""
+        own = self.self_ns()
+        stats = dict()
+        for path, count, total in zip(self.paths, self.counts, self.total_ns):
+            key = ('blackjack', 0, path[-1])
+            calls, _, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, dict()))
+            stats[key] = (calls + count, calls + count, tt + own[path] / 1e9, ct + total / 1e9, callers)
+            if len(path) > 1:
+                caller = ('blackjack', 0, path[-2])
+                c_calls, _, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c_calls + count, c_calls + count, c_tt + own[path] / 1e9, c_ct + total / 1e9)
+        with open(filename, 'wb') as prof:
+            marshal.dump(stats, prof)
+
+    def export_trace(self, filename):
+        """Write the events in the ring buffer as complete ('X') events in the Chrome trace format."""
+        trace = [{'name': path[-1], 'cat': path[0], 'ph': 'X', 'pid': 0, 'tid': thread,
+                  'ts': start / 1e3, 'dur': duration / 1e3}
+                 for path, thread, start, duration in self.events()]
+        with open(filename, 'w') as trace_file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def export(self, filename):
+        if filename.endswith('.folded'):
+            self.export_folded(filename)
+        elif filename.endswith('.json'):
+            self.export_trace(filename)
+        else:
+            self.export_pstats(filename)
+
+
+def instrument_game(game, profiler, state_names):
+    """Time every update of a GameState, filed by state or transition, and every new shoe it makes.
+
+    GameState shuffles its first shoe on a thread started in __init__, so this has to run before
+    that to catch it; GameState(profiler=...) calls it at the right point.
+
+    """
+    def transition(before):
+        after = state_names[game.state]
+        return before if after == before else '{}->{}'.format(before, after)
+
+    game.update = profiler.wrap(game.update, lambda: state_names[game.state], rename=transition)
+    game.new_shoe = profiler.wrap(game.new_shoe, 'new_shoe')
+
+
+def instrument_dovetail(profiler):
+    """Time dovetail.shuffle and the splits and riffles it is made of, wherever they are called from."""
+    for name in ['shuffle', 'binomial_split', 'riffle']:
+        setattr(dovetail, name, profiler.wrap(getattr(dovetail, name), 'dovetail.' + name))
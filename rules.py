@@ -0,0 +1,63 @@
+"""Table rules.
+
+The defaults are the settings blackjack02.GameState has always used: 8 decks, the dealer stands on
+soft 17, blackjack pays 3:2, one split per hand with no doubling after it, and no surrender.
+GameState and fastgame.FastTable follow hit_soft_17, num_decks and blackjack_payout; the remaining
+options are only understood by houseedge.py for now.
+
+These options don't describe everything about how GameState plays. It has quirks of its own, such
+as never drawing against an ace upcard and paying any 21 as a blackjack, so houseedge.py, which
+models ordinary casino play, does not give GameState's edge under the same Rules.
+
+"""
+import argparse
+
+
+class Rules:
+    def __init__(self, hit_soft_17=False, num_decks=8, double_after_split=False, resplit_aces=False,
+                 surrender=False, blackjack_payout=(3, 2)):
+        self.hit_soft_17 = hit_soft_17
+        self.num_decks = num_decks
+        self.double_after_split = double_after_split
+        self.resplit_aces = resplit_aces
+        self.surrender = surrender
+        self.blackjack_payout = blackjack_payout
+
+    def __repr__(self):
+        return ('Rules(hit_soft_17={}, num_decks={}, double_after_split={}, resplit_aces={}, surrender={}, '
+                'blackjack_payout={})'.format(self.hit_soft_17, self.num_decks, self.double_after_split,
+                                              self.resplit_aces, self.surrender, self.blackjack_payout))
+
+    def dealer_hits(self, total, soft):
+        """Whether the dealer draws to a hand worth total, soft if an ace is being counted as 11."""
+        return total < 17 or (total == 17 and soft and self.hit_soft_17)
+
+    def blackjack_winnings(self, bet):
+        """Chips won on top of the returned bet for a blackjack, rounded down like the rest of the payouts."""
+        numerator, denominator = self.blackjack_payout
+        return bet * numerator // denominator
+
+    def blackjack_ratio(self):
+        numerator, denominator = self.blackjack_payout
+        return numerator / denominator
+
+
+def payout(text):
+    """Parse a blackjack payout written like 3:2, for argparse."""
+    try:
+        numerator, denominator = (int(n) for n in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a payout like 3:2, not {!r}'.format(text))
+    return numerator, denominator
+
+
+def add_rules_arguments(parser):
+    """Add options for the rules GameState and fastgame.FastTable follow to an argparse parser."""
+    parser.add_argument('--decks', type=int, default=8)
+    parser.add_argument('--h17', action='store_true', help='dealer hits soft 17')
+    parser.add_argument('--payout', type=payout, default=(3, 2), help='blackjack payout, e.g. 6:5')
+
+
+def rules_from_arguments(args, **options):
+    """Build Rules from options added by add_rules_arguments, and any others passed as keywords."""
+    return Rules(hit_soft_17=args.h17, num_decks=args.decks, blackjack_payout=args.payout, **options)
@@ -0,0 +1,148 @@
+"""Shuffle shoes ahead of time in separate processes, handing them over through shared memory.
+
+A ShoePool keeps a ring of shoe-sized slots in one multiprocessing.shared_memory block, and a set of
+producer processes that keep shuffling shoes into free slots. Each card is a single byte (value * 4 +
+suit). Only slot numbers go through the pool's queues, so no shoe is pickled on its way between
+processes. A ShoeClient taking a shoe copies its bytes out of the slot and frees the slot at once;
+the copy is a few hundred bytes, and the tables need a list they can pop cards from anyway.
+
+Which shuffle the producers use ('dovetail' or 'fast', see SHUFFLERS) makes no difference to the
+consumers beyond how often they find a shoe waiting. Shoes from a pool arrive in whatever order the
+producers finish them, so unlike fastgame.ShoeFactory, runs fed from a pool aren't repeatable.
+
+"""
+import multiprocessing
+import multiprocessing.connection
+import queue
+import random
+import threading
+from multiprocessing import shared_memory
+
+import dovetail
+
+SHUFFLERS = ['dovetail', 'fast']
+VALUES = bytes(card >> 2 for card in range(256))    # bytes.translate table from card byte to value
+POLL_SECONDS = 0.1
+
+
+def encode(cards):
+    return bytes(value << 2 | suit for value, suit in cards)
+
+
+def produce(memory_name, slot_size, num_decks, shuffler, seed, free, ready, stop):
+    """Producer process: shuffle shoes into free slots until told to stop."""
+    memory = shared_memory.SharedMemory(memory_name)
+    rng = random.Random(seed)
+    cards = [(v, s) for _ in range(num_decks) for v in range(1, 14) for s in range(4)]
+    try:
+        while not stop.is_set():
+            if shuffler == 'dovetail':
+                shoe = dovetail.shuffle(cards)
+            else:
+                shoe = cards[:]
+                rng.shuffle(shoe)
+            while not stop.is_set():
+                try:
+                    slot = free.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                memory.buf[slot * slot_size:(slot + 1) * slot_size] = encode(shoe)
+                ready.put(slot)
+                break
+    finally:
+        memory.close()
+
+
+class ShoeClient:
+    """Take shoes from a ShoePool, in this process or any other it is passed to.
+
+    Calling a client returns the next shoe as a list of card values, so it can stand in for
+    fastgame.CardValues(fastgame.ShoeFactory(...)). Every shoe is copied out of shared memory, so
+    nothing handed out refers to a slot after it has been freed.
+
+    """
+    def __init__(self, memory_name, slot_size, free, ready, producers_gone):
+        self.memory_name = memory_name
+        self.slot_size = slot_size
+        self.free = free
+        self.ready = ready
+        self.producers_gone = producers_gone
+        self.memory = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['memory'] = None
+        return state
+
+    def take(self):
+        """Return the next shoe's card bytes, copied out of its slot, and free the slot for reuse."""
+        if self.memory is None:
+            self.memory = shared_memory.SharedMemory(self.memory_name)
+        while True:
+            try:
+                slot = self.ready.get(timeout=POLL_SECONDS)
+                break
+            except queue.Empty:
+                if self.producers_gone.is_set():
+                    raise RuntimeError('Every producer of the ShoePool has stopped, so no more shoes are coming')
+        shoe = bytes(self.memory.buf[slot * self.slot_size:(slot + 1) * self.slot_size])
+        self.free.put(slot)
+        return shoe
+
+    def __call__(self):
+        return list(self.take().translate(VALUES))
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+
+class ShoePool:
+    def __init__(self, producers=2, slots=64, num_decks=8, shuffler='fast', seed=None):
+        if shuffler not in SHUFFLERS:
+            raise ValueError('Unknown shuffler {!r}, expected one of {}'.format(shuffler, SHUFFLERS))
+        self.num_decks = num_decks
+        self.slot_size = 52 * num_decks
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * self.slot_size)
+        self.free = multiprocessing.Queue()
+        self.ready = multiprocessing.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.stop = multiprocessing.Event()
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.producers = [multiprocessing.Process(target=produce, daemon=True,
+                                                  args=(self.memory.name, self.slot_size, num_decks, shuffler,
+                                                        seed + i, self.free, self.ready, self.stop))
+                          for i in range(producers)]
+        for producer in self.producers:
+            producer.start()
+        self.producers_gone = multiprocessing.Event()
+        threading.Thread(target=self.watch_producers, daemon=True).start()
+
+    def watch_producers(self):
+        """Set producers_gone once every producer has exited, however it went, so clients stop waiting."""
+        sentinels = [producer.sentinel for producer in self.producers]
+        while sentinels:
+            for sentinel in multiprocessing.connection.wait(sentinels):
+                sentinels.remove(sentinel)
+        self.producers_gone.set()
+
+    def client(self):
+        return ShoeClient(self.memory.name, self.slot_size, self.free, self.ready, self.producers_gone)
+
+    def close(self):
+        self.stop.set()
+        for producer in self.producers:
+            producer.join(timeout=1)
+            if producer.is_alive():
+                producer.terminate()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,223 @@
+"""Simulate many hands of blackjack with a strategy and a bet sizing policy.
+
+Hands are played on fastgame.FastTable with seeded shoes, so a run is repeatable from its seed.
+Each worker process plays its own seeded stretch of hands, and the results are combined at the end.
+With --shoe-pool, shoes come from a shoepool.ShoePool shuffling on other cores instead; that is
+faster with a slow shuffler, but the run is no longer repeatable.
+
+With --checkpoint, the hands are played in rounds of --checkpoint-every per worker, and after each
+round the state of every worker (its table, shoe, count, RNG and analytics) is saved to the
+checkpoint file. Running the same command again resumes from it, and gives exactly the results an
+uninterrupted run would have.
+
+Run with, e.g.:     python simulate.py --hands 1000000 --strategy basic.strategy --bet ramp --unit 5
+
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import zlib
+
+import analytics
+import fastgame
+import shoepool
+import strategy
+from rules import Rules, add_rules_arguments, rules_from_arguments
+
+DEFAULT_STRATEGY = 'basic.strategy'
+STARTING_CHIPS = 100
+
+shoe_client = None      # set in each worker when shoes come from a ShoePool
+
+
+class Simulation:
+    """Play hands one after another at a single table, until the chips run out or restart() refills them."""
+
+    def __init__(self, compiled_strategy, bet_policy, seed=None, rules=None, chips=STARTING_CHIPS, new_shoe=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        rules = rules or Rules()
+        if new_shoe is None:
+            new_shoe = fastgame.CardValues(fastgame.ShoeFactory(seed, rules.num_decks))
+        self.counter = strategy.HiLoCounter(new_shoe)
+        self.table = fastgame.FastTable(self.counter, chips, rules)
+        self.player = compiled_strategy.player()
+        self.bet_policy = bet_policy
+        self.hands_played = 0
+
+    def restart(self, chips):
+        """Put the table's chips back to chips, at the start of a new bankroll trajectory."""
+        self.table.chips = chips
+
+    def play(self):
+        """Play one hand and return the change in chips."""
+        if self.table.chips < 1:
+            raise ValueError('No chips left to bet after {} hands'.format(self.hands_played))
+        if len(self.table.shoe) < fastgame.RESHUFFLE_AT:
+            # reshuffle here rather than in FastTable.play, so the hand is bet on the new shoe's count
+            self.table.shoe = self.counter()
+        true_count = self.counter.true_count()
+        self.player.new_hand(true_count)
+        self.hands_played += 1
+        return self.table.play(self.bet_policy.bet(true_count, self.table.chips), self.player)
+
+    def __getstate__(self):
+        # the compiled strategy never changes and is most of the size, so checkpoints leave it out;
+        # run_worker gives a resumed simulation a fresh Player, which holds nothing between hands
+        state = self.__dict__.copy()
+        state.pop('player', None)
+        return state
+
+    def deltas(self, hands):
+        """Yield the chip change of each of the next hands."""
+        for _ in range(hands):
+            yield self.play()
+
+
+def run_worker(compiled_strategy, bet_policy, rules, seed, hands, analytics_options, state=None):
+    """Play hands on one Simulation, streaming the chip changes into a BankrollAnalytics.
+
+    The table plays with the analytics' bankroll, and is restarted from it along with every new
+    trajectory, so the two always agree on the chips.
+
+    state, the (simulation, analytics) returned by an earlier call, carries on where that call left
+    off. The simulation is left out of the returned state when its shoes come from a ShoePool.
+
+    """
+    if state is None:
+        results = analytics.BankrollAnalytics(seed=seed, **analytics_options)
+        simulation = Simulation(compiled_strategy, bet_policy, seed, rules, results.bankroll, shoe_client)
+    else:
+        simulation, results = state
+        simulation.player = compiled_strategy.player()
+    results.feed(simulation.deltas(hands), simulation.restart)
+    return (None if shoe_client else simulation), results
+
+
+def _run_worker(args):
+    return run_worker(*args)
+
+
+def _attach_shoe_client(client):
+    global shoe_client
+    shoe_client = client
+
+
+def save_checkpoint(filename, checkpoint):
+    """Write a checkpoint next to filename and move it into place, so a crash never leaves half a file."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+    try:
+        with os.fdopen(handle, 'wb') as checkpoint_file:
+            checkpoint_file.write(zlib.compress(pickle.dumps(checkpoint, pickle.HIGHEST_PROTOCOL)))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def load_checkpoint(filename):
+    with open(filename, 'rb') as checkpoint_file:
+        return pickle.loads(zlib.decompress(checkpoint_file.read()))
+
+
+def run(compiled_strategy, bet_policy, hands, seed=0, workers=1, shoe_pool=None, checkpoint=None,
+        checkpoint_every=None, rules=None, **analytics_options):
+    """Split hands across worker processes seeded seed, seed + 1, ... and merge their analytics.
+
+    Every table plays by rules, or the default Rules. If a shoepool.ShoePool is given, every worker
+    takes its shoes from it. If a checkpoint file is given, the run resumes from it when it exists,
+    and saves to it every checkpoint_every hands per worker. Any other keyword arguments are passed
+    on to analytics.BankrollAnalytics.
+
+    """
+    rules = rules or Rules()
+    if checkpoint and shoe_pool:
+        raise ValueError('Runs fed from a ShoePool are not repeatable, so they cannot be checkpointed')
+    if shoe_pool and shoe_pool.num_decks != rules.num_decks:
+        raise ValueError('The ShoePool deals {}-deck shoes, but the rules are for {} decks'.format(
+            shoe_pool.num_decks, rules.num_decks))
+    client = shoe_pool.client() if shoe_pool else None
+    shares = [hands // workers + (1 if i < hands % workers else 0) for i in range(workers)]
+    shares = [share for share in shares if share]
+    run_key = (compiled_strategy.name, type(bet_policy).__name__, sorted(vars(bet_policy).items()), hands, seed,
+               workers, repr(rules), sorted(analytics_options.items()))
+    done = [0] * len(shares)
+    states = [None] * len(shares)
+    if checkpoint and os.path.exists(checkpoint):
+        saved = load_checkpoint(checkpoint)
+        if saved['run'] != run_key:
+            raise ValueError('Checkpoint {} was saved by a different run: {}'.format(checkpoint, saved['run']))
+        done, states = saved['done'], saved['states']
+    round_hands = checkpoint_every if checkpoint and checkpoint_every else hands
+
+    pool = None
+    if workers == 1:
+        _attach_shoe_client(client)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_attach_shoe_client, initargs=(client,))
+    try:
+        while done != shares:
+            jobs = [(compiled_strategy, bet_policy, rules, seed + i, min(round_hands, share - done[i]), analytics_options, state)
+                    for i, (share, state) in enumerate(zip(shares, states))]
+            states = pool.map(_run_worker, jobs) if pool else [run_worker(*job) for job in jobs]
+            done = [min(finished + round_hands, share) for finished, share in zip(done, shares)]
+            if checkpoint:
+                save_checkpoint(checkpoint, {'run': run_key, 'done': done, 'states': states})
+    except BaseException:
+        # an interrupted map never finishes, so close() and join() would wait on it forever
+        if pool:
+            pool.terminate()
+        raise
+    if pool:
+        pool.close()
+        pool.join()
+    merged = states[0][1]
+    for _, result in states[1:]:
+        merged.merge(result)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hands', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--strategy', default=DEFAULT_STRATEGY, help='strategy chart file')
+    parser.add_argument('--bet', default='flat', choices=sorted(strategy.BET_POLICIES))
+    parser.add_argument('--unit', type=int, default=5, help='betting unit in chips')
+    parser.add_argument('--bankroll', type=int, default=STARTING_CHIPS, help='chips at the start of each trajectory')
+    parser.add_argument('--horizon', type=int, default=10000, help='hands per bankroll trajectory')
+    parser.add_argument('--shoe-pool', type=int, default=0, metavar='PRODUCERS',
+                        help='shuffle shoes in this many separate processes')
+    parser.add_argument('--shuffler', default='fast', choices=shoepool.SHUFFLERS, help='shuffle used by --shoe-pool')
+    parser.add_argument('--checkpoint', metavar='FILE', help='save progress to FILE, and resume from it if it exists')
+    parser.add_argument('--checkpoint-every', type=int, default=1000000, metavar='HANDS',
+                        help='hands per worker between checkpoints')
+    add_rules_arguments(parser)
+    args = parser.parse_args()
+    rules = rules_from_arguments(args)
+
+    compiled_strategy = strategy.load(args.strategy)
+    bet_policy = strategy.BET_POLICIES[args.bet](args.unit)
+    pool = shoepool.ShoePool(args.shoe_pool, num_decks=rules.num_decks, shuffler=args.shuffler,
+                             seed=args.seed) if args.shoe_pool else None
+    try:
+        results = run(compiled_strategy, bet_policy, args.hands, args.seed, args.workers, pool,
+                      args.checkpoint, args.checkpoint_every, rules, bankroll=args.bankroll, horizon=args.horizon)
+    finally:
+        if pool:
+            pool.close()
+    print('{} hands with {} and {} betting'.format(results.hands.count, compiled_strategy.name, args.bet))
+    print('    per hand:  {:+.4f} (standard deviation {:.3f})'.format(results.hands.mean, results.hands.deviation()))
+    print(results.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""Playing strategies and bet sizing for the simulations.
+
+A Strategy decides what to do for a hand state (hard total, soft total, pair, or the insurance
+offer), the dealer's upcard and the true count. Before a run it is compiled into flat lookup tables,
+one character per encoded state, so a decision in the hot loop is a single string index.
+
+Strategies are usually written as charts in a compact text file, one row per line:
+
+    # comment
+    h16     SSSSSHHHHH      hard 16 against dealer 2, 3, ... 9, 10, A
+    s18     SXXXXSSHHH      soft 18
+    p8      PPPPPPPPPP      pair of 8s (p1 is aces, p10 any two equal ten-value cards)
+    ins     N               the insurance offer, against an ace
+    h16@0   SSSSSHHHSH      from a true count of 0 upwards; @-1 would be -1 and below
+
+Actions are H(it), S(tand), D(ouble, else hit), X (double, else stand), P(split, on pair rows only)
+and Y/N (insure or not, on the ins row only). Later lines override earlier ones, and any rows left
+out default to hitting below 17 and not splitting. Bet sizing is kept apart from strategy, as a
+BetPolicy with a bet(true_count, chips) method.
+
+"""
+import fastgame
+
+UPCARDS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 1]     # chart column order
+MIN_COUNT = -5
+MAX_COUNT = 5
+COUNT_BUCKETS = MAX_COUNT - MIN_COUNT + 1
+
+HARD_ROWS = 0           # hard 4 - 21
+SOFT_ROWS = 18          # soft 12 - 21
+PAIR_ROWS = 28          # pairs of 1 - 10
+INSURANCE_ROW = 38
+NUM_ROWS = 39
+TABLE_SIZE = NUM_ROWS * 10 * COUNT_BUCKETS
+ROW_KINDS = (HARD_ROWS, SOFT_ROWS, PAIR_ROWS, INSURANCE_ROW)
+
+FALLBACKS = {'D': 'H', 'X': 'S'}
+ROW_ACTIONS = {HARD_ROWS: 'HSDX', SOFT_ROWS: 'HSDX', PAIR_ROWS: 'HSDXP', INSURANCE_ROW: 'YN'}
+SAFE_ACTIONS = {HARD_ROWS: 'HS', SOFT_ROWS: 'HS', PAIR_ROWS: 'HS', INSURANCE_ROW: 'YN'}    # never refused
+HI_LO = [0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1]     # by card value, index 0 unused
+
+
+def count_bucket(true_count):
+    return min(max(int(round(true_count)), MIN_COUNT), MAX_COUNT) - MIN_COUNT
+
+
+def encode(phase, cards, upcard, bucket):
+    """Map a decision to its index in a compiled table."""
+    if phase == fastgame.INSURE:
+        row = INSURANCE_ROW
+    elif phase == fastgame.PLAY and len(cards) == 2 and cards[0] == cards[1]:
+        row = PAIR_ROWS + min(cards[0], 10) - 1
+    else:
+        total = 0
+        ace = False
+        for value in cards:
+            total += min(value, 10)
+            if value == 1:
+                ace = True
+        if ace and total <= 11:
+            row = SOFT_ROWS + total - 2     # soft 12 counted as 2
+        else:
+            row = HARD_ROWS + min(total, 21) - 4
+    return (row * 10 + min(upcard, 10) - 1) * COUNT_BUCKETS + bucket
+
+
+class Strategy:
+    """Base class for playing strategies; subclasses implement choose()."""
+
+    name = 'strategy'
+
+    def choose(self, row, upcard, true_count):
+        """Return the chart action for a row (see the *_ROWS offsets), upcard (1 - 10) and true count."""
+        raise NotImplementedError
+
+    def compile(self):
+        """Flatten the strategy into three lookup tables: first choice, then what to do if refused, twice."""
+        first = []
+        second = []
+        third = []
+        for row in range(NUM_ROWS):
+            for upcard in range(1, 11):
+                for bucket in range(COUNT_BUCKETS):
+                    true_count = bucket + MIN_COUNT
+                    chain = [self.choose(row, upcard, true_count)]
+                    while len(chain) < 3:
+                        action = chain[-1]
+                        if action == 'P' and row_kind(row) == PAIR_ROWS:
+                            action = self.choose(unpaired_row(row), upcard, true_count)
+                        else:
+                            action = FALLBACKS.get(action, action)
+                        chain.append(action)
+                    # the last table is used for every refusal after the second, so it must hold an
+                    # action that is never refused or the table would ask forever
+                    if chain[2] not in SAFE_ACTIONS[row_kind(row)]:
+                        chain[2] = default_action(row)
+                    first.append(chain[0])
+                    second.append(chain[1])
+                    third.append(chain[2])
+        return CompiledStrategy(self.name, *[''.join(table).replace('X', 'D') for table in (first, second, third)])
+
+
+def row_kind(row):
+    """Return the offset of the kind of row a row is: HARD_ROWS, SOFT_ROWS, PAIR_ROWS or INSURANCE_ROW."""
+    return max(kind for kind in ROW_KINDS if kind <= row)
+
+
+def default_action(row):
+    """Return the action for a row a chart leaves out: no insurance, never split, hit below 17."""
+    kind = row_kind(row)
+    if kind == INSURANCE_ROW:
+        return 'N'
+    if kind == PAIR_ROWS:
+        return default_action(unpaired_row(row))
+    if kind == SOFT_ROWS:
+        return 'H' if row - SOFT_ROWS + 12 < 17 else 'S'
+    return 'H' if row - HARD_ROWS + 4 < 17 else 'S'
+
+
+def unpaired_row(row):
+    """Return the hard or soft row a pair row is played as when it can't be split."""
+    if row_kind(row) != PAIR_ROWS:
+        raise ValueError('Row {} is not a pair row'.format(row))
+    rank = row - PAIR_ROWS + 1
+    if rank == 1:
+        return SOFT_ROWS
+    return HARD_ROWS + 2 * rank - 4
+
+
+class ChartStrategy(Strategy):
+    """A strategy read from a chart, see the module docstring for the format."""
+
+    def __init__(self, rows, name='chart'):
+        self.name = name
+        self.rows = rows    # {row: [(count_from, count_to, actions by upcard 1 - 10), ...]}
+
+    @classmethod
+    def parse(cls, text, name='chart'):
+        rows = {}
+        for line_number, line in enumerate(text.splitlines(), 1):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise ValueError('Expected a row and its actions on line {} of strategy {}'.format(line_number, name))
+            label, actions = fields
+            count_from, count_to = MIN_COUNT, MAX_COUNT
+            try:
+                if '@' in label:
+                    label, index = label.split('@')
+                    if int(index) >= 0:
+                        count_from = int(index)
+                    else:
+                        count_to = int(index)
+                row = parse_row(label)
+            except ValueError:
+                raise ValueError('Invalid row {!r} on line {} of strategy {}'.format(label, line_number, name))
+            if row == INSURANCE_ROW:
+                actions = actions * 10
+            allowed = ROW_ACTIONS[row_kind(row)]
+            if len(actions) != 10 or any(action not in allowed for action in actions):
+                raise ValueError('Invalid actions {!r} on line {} of strategy {}'.format(actions, line_number, name))
+            by_upcard = [actions[UPCARDS.index(upcard)] for upcard in range(1, 11)]
+            rows.setdefault(row, []).append((count_from, count_to, by_upcard))
+        return cls(rows, name)
+
+    def choose(self, row, upcard, true_count):
+        for count_from, count_to, by_upcard in reversed(self.rows.get(row, [])):
+            if count_from <= true_count <= count_to:
+                return by_upcard[upcard - 1]
+        if row_kind(row) == PAIR_ROWS:
+            return self.choose(unpaired_row(row), upcard, true_count)
+        return default_action(row)
+
+
+def parse_row(label):
+    kind, number = label[0], label[1:]
+    if label == 'ins':
+        return INSURANCE_ROW
+    number = int(number)
+    if kind == 'h' and 4 <= number <= 21:
+        return HARD_ROWS + number - 4
+    if kind == 's' and 12 <= number <= 21:
+        return SOFT_ROWS + number - 12
+    if kind == 'p' and 1 <= number <= 10:
+        return PAIR_ROWS + number - 1
+    raise ValueError(label)
+
+
+def load(filename):
+    """Load a chart strategy from a file and compile it."""
+    with open(filename) as strategy_file:
+        return ChartStrategy.parse(strategy_file.read(), name=filename).compile()
+
+
+class CompiledStrategy:
+    def __init__(self, name, first, second, third):
+        assert len(first) == len(second) == len(third) == TABLE_SIZE
+        self.name = name
+        self.tables = (first, second, third)
+
+    def player(self):
+        return Player(self.tables)
+
+
+class Player:
+    """Make decisions for fastgame.FastTable from a compiled strategy at the count set for the hand.
+
+    FastTable asks again when an action is refused (a double or split it can't afford, say), so a
+    repeat of the same question moves on to the next fallback table.
+
+    """
+    def __init__(self, tables):
+        self.tables = tables
+        self.bucket = count_bucket(0)
+        self.last = None
+        self.attempt = 0
+
+    def new_hand(self, true_count):
+        self.bucket = count_bucket(true_count)
+        self.last = None
+
+    def __call__(self, phase, cards, upcard):
+        question = (phase, tuple(cards))
+        if question == self.last:
+            self.attempt = min(self.attempt + 1, 2)
+        else:
+            self.last = question
+            self.attempt = 0
+        return self.tables[self.attempt][encode(phase, cards, upcard, self.bucket)]
+
+
+class HiLoCounter:
+    """Wrap a shoe factory and keep a Hi-Lo running count of the cards dealt from each shoe."""
+
+    def __init__(self, new_shoe):
+        self.new_shoe = new_shoe
+        self.shoe = list()
+        self.full = list()
+        self.seen = 0
+        self.running_count = 0
+
+    def __call__(self):
+        self.shoe = self.new_shoe()
+        self.full = self.shoe[:]
+        self.seen = len(self.shoe)
+        self.running_count = 0
+        return self.shoe
+
+    def true_count(self):
+        remaining = len(self.shoe)
+        for value in self.full[remaining:self.seen]:
+            self.running_count += HI_LO[value]
+        self.seen = remaining
+        return self.running_count * 52 / max(remaining, 1)
+
+
+class BetPolicy:
+    """Base class for bet sizing; subclasses implement bet()."""
+
+    def bet(self, true_count, chips):
+        raise NotImplementedError
+
+
+class FlatBet(BetPolicy):
+    def __init__(self, unit=5):
+        self.unit = unit
+
+    def bet(self, true_count, chips):
+        return max(1, min(self.unit, chips))
+
+
+class RampBet(BetPolicy):
+    """Bet one unit up to a true count of 1, then one more unit per point of count, up to a cap."""
+
+    def __init__(self, unit=5, max_units=8):
+        self.unit = unit
+        self.max_units = max_units
+
+    def bet(self, true_count, chips):
+        units = min(max(int(true_count), 1), self.max_units)
+        return max(1, min(units * self.unit, chips))
+
+
+BET_POLICIES = {
+    'flat': FlatBet,
+    'ramp': RampBet,
+}
@@ -0,0 +1,24 @@
+"""Quick cross-check of the fast engines against blackjack02.GameState, for pytest.
+
+The million-hand check is marked slow; longer runs still go through crosscheck.py itself.
+
+"""
+import pytest
+
+import crosscheck
+from rules import Rules
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_engines_match_reference(seed):
+    assert crosscheck.check_session(seed, 2000) is None
+
+
+def test_engines_match_reference_under_other_rules():
+    rules = Rules(hit_soft_17=True, num_decks=2, blackjack_payout=(6, 5))
+    assert crosscheck.check_session(0, 2000, rules=rules) is None
+
+
+@pytest.mark.slow
+def test_a_million_hands_match_reference():
+    assert crosscheck.check(1000000, seed=1000) is None
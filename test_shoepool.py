@@ -0,0 +1,16 @@
+"""Tests for shoepool.py."""
+import pytest
+
+import shoepool
+
+
+def test_client_raises_once_every_producer_is_gone():
+    with shoepool.ShoePool(producers=2, slots=4, num_decks=1) as pool:
+        client = pool.client()
+        assert sorted(client()) == sorted(value for value in range(1, 14) for _ in range(4))
+        for producer in pool.producers:
+            producer.kill()
+        with pytest.raises(RuntimeError):
+            for _ in range(5):
+                client()
+        client.close()
@@ -0,0 +1,38 @@
+"""Tests for simulate.py."""
+import pytest
+
+import fastgame
+import simulate
+import strategy
+
+
+def test_first_hand_of_a_new_shoe_is_played_at_count_zero():
+    simulation = simulate.Simulation(strategy.load(simulate.DEFAULT_STRATEGY), strategy.FlatBet(), seed=1, chips=10 ** 9)
+    new_shoes = 0
+    for _ in range(2000):
+        new_shoe = len(simulation.table.shoe) < fastgame.RESHUFFLE_AT
+        simulation.play()
+        if new_shoe:
+            new_shoes += 1
+            assert simulation.player.bucket == strategy.count_bucket(0)
+    assert new_shoes
+
+
+def test_checkpointed_run_resumes_where_it_stopped(tmp_path, monkeypatch):
+    compiled_strategy = strategy.load(simulate.DEFAULT_STRATEGY)
+    options = dict(hands=20000, seed=5, workers=2, horizon=1000)
+    expected = simulate.run(compiled_strategy, strategy.RampBet(), **options).report()
+
+    checkpoint = str(tmp_path / 'run.checkpoint')
+    save_checkpoint = simulate.save_checkpoint
+
+    def save_and_stop(filename, saved):
+        save_checkpoint(filename, saved)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(simulate, 'save_checkpoint', save_and_stop)
+    with pytest.raises(KeyboardInterrupt):
+        simulate.run(compiled_strategy, strategy.RampBet(), checkpoint=checkpoint, checkpoint_every=5000, **options)
+    monkeypatch.undo()
+    resumed = simulate.run(compiled_strategy, strategy.RampBet(), checkpoint=checkpoint, checkpoint_every=5000, **options)
+    assert resumed.report() == expected